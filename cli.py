@@ -1,20 +1,20 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import getpass
 import time
 from typer import Option, Typer, Argument
 import os
 import re
-from pydub import AudioSegment
 import io
 
 from src.config import AudioAIFunction
 from src.utils import display_available_voices, estimate_cost
-from src.audio_processing import validate_audio_filepath
+from src.audio_processing import concatenate_segments, get_audio_duration_ms, validate_audio_filepath
 from src.voice_management import VoiceManager
 from client import clean_audio, transcribe_audio
 from src.script_generation import generate_script
-from src.audio_generation import write_podcast_audio
+from src.audio_generation import TTS_CACHE_DIR, TTS_MAX_WORKERS, write_podcast_audio
 
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -65,7 +65,8 @@ def script(
     transcription_file: str = Argument(..., help="Path to the transcription file"),
     length: int = Argument(10, help="Target length of the script in minutes"),
     audience: str = Argument("general", help="Target audience"),
-    type: str = Argument("discussion", help="Type of podcast")
+    type: str = Argument("discussion", help="Type of podcast"),
+    no_cache: bool = Option(False, "--no-cache", help="Generate a new script even if this transcript was scripted before")
 ):
     """Generate a podcast script from a transcription file."""
     try:
@@ -73,7 +74,8 @@ def script(
             transcription_file,
             length_minutes=length,
             audience=audience,
-            type=type
+            type=type,
+            use_cache=not no_cache
         )
         print(f"Successfully generated script. Output saved to: {script_path}")
     except Exception as e:
@@ -91,7 +93,9 @@ def list_voices():
 
 @app.command(no_args_is_help=True)
 def generate_podcast_audio(
-    script_file: str = Argument(..., help="Path to the script file")
+    script_file: str = Argument(..., help="Path to the script file"),
+    tts_workers: int = Option(TTS_MAX_WORKERS, "--tts-workers", help="Concurrent text-to-speech requests; keep within your ElevenLabs plan's limit"),
+    no_cache: bool = Option(False, "--no-cache", help="Synthesize every line even if an earlier run cached it")
 ):
     """Generate a podcast from a script file using available or selected voices."""
     try:
@@ -135,7 +139,12 @@ def generate_podcast_audio(
                     print(f"Voice '{voice_name}' not found. Try again.")
         
         print("\nGenerating podcast audio...")
-        output_path = write_podcast_audio(script_file, speaker_voice_ids)
+        output_path = write_podcast_audio(
+            script_file,
+            speaker_voice_ids,
+            max_workers=tts_workers,
+            cache_dir=None if no_cache else TTS_CACHE_DIR,
+        )
         if output_path:
             print(f"Successfully generated podcast audio: {output_path}")
         else:
@@ -152,12 +161,13 @@ def podcast_from_conversation(
     length_minutes: int = Argument(15, help="Target podcast length in minutes"),
     audience: str = Argument("general", help="Target audience"),
     podcast_type: str = Argument("informative", help="Podcast type"),
-    clean_audio_flag: bool = Option(False, "--clean-audio", help="Clean audio before processing")
+    clean_audio_flag: bool = Option(False, "--clean-audio", help="Clean audio before processing"),
+    tts_workers: int = Option(TTS_MAX_WORKERS, "--tts-workers", help="Concurrent text-to-speech requests; keep within your ElevenLabs plan's limit"),
+    no_cache: bool = Option(False, "--no-cache", help="Generate a new script even if this transcript was scripted before")
 ):
     """Generate a podcast from a conversation audio file (full pipeline)."""
-    validate_audio_filepath(input_file)
-    audio = AudioSegment.from_file(input_file)
-    audio_length_ms = len(audio)
+    fmt = validate_audio_filepath(input_file)
+    audio_length_ms = get_audio_duration_ms(input_file)
     
     # Cost Estimation (using utils)
     target_length = min(length_minutes, audio_length_ms / 60000)
@@ -179,7 +189,7 @@ def podcast_from_conversation(
     if input("\nProceed? [y/N]: ").lower() != 'y':
         print("Cancelled.")
         return
-    
+
     # Step 1: Clean (Optional)
     processed_audio_path = input_file
     if clean_audio_flag:
@@ -194,6 +204,18 @@ def podcast_from_conversation(
             raise Exception("Transcription failed.")
     print(f"Transcription saved to: {transcription_path}")
 
+    # Voice samples are cut from the original audio, so decode it in the background while
+    # the script is generated. It starts only now so an earlier failure doesn't have to
+    # wait for a full-file decode before the process can exit
+    from pydub import AudioSegment
+
+    def decode_source_audio():
+        # Samples are uploaded as mono; downmix once here instead of per speaker
+        return AudioSegment.from_file(input_file, format=fmt).set_channels(1)
+
+    decode_executor = ThreadPoolExecutor(max_workers=1)
+    source_audio_future = decode_executor.submit(decode_source_audio)
+    decode_executor.shutdown(wait=False)
     
     # Step 3: Generate Script
     print("\n=== Generating Script ===")
@@ -201,7 +223,8 @@ def podcast_from_conversation(
         transcription_path, 
         length_minutes=int(target_length), # Use calculated target length
         audience=audience,
-        type=podcast_type
+        type=podcast_type,
+        use_cache=not no_cache
     )
     print(f"Script saved to: {script_path}")
     
@@ -212,32 +235,40 @@ def podcast_from_conversation(
     samples = vm.extract_samples_from_transcription(raw_transcription, clone_sample_length_ms)
     
     speaker_voice_ids = {}
-    sample_files_to_delete = []
-    for speaker_id, segments in samples.items():
-        if not segments: continue
-        samples_audio = AudioSegment.empty()
-        try:
-            fmt = validate_audio_filepath(input_file) # Validate original file
-            source_audio = AudioSegment.from_file(input_file, format=fmt)
-            for start, end in segments:
-                samples_audio += source_audio[int(start):int(end)]
-        except Exception as e:
-            print(f"Warning: Error extracting samples for {speaker_id}: {e}")
-            continue
-                        
+    voice_sample_files = {}
+    try:
+        source_audio = source_audio_future.result()
+    except Exception as e:
+        print(f"Warning: Error decoding {input_file} for voice samples: {e}")
+        samples = {}
+
+    clone_date = datetime.now().strftime('%Y%m%d')
+
+    def export_and_clone(speaker_id, segments):
+        samples_audio = concatenate_segments([source_audio[int(start):int(end)] for start, end in segments])
         voice_sample_file = os.path.join(vm.sample_dir, f"{speaker_id}.mp3")
-        samples_audio.export(voice_sample_file, format="mp3", parameters=["-ac", "1"])
-        sample_files_to_delete.append(voice_sample_file)
-        
+        samples_audio.export(voice_sample_file, format="mp3")
+        voice_sample_files[speaker_id] = voice_sample_file
         print(f"Cloning voice for {speaker_id}...")
-        try:
-            voice_id = vm.clone_voice(voice_sample_file, f"Podcast_{speaker_id}_{datetime.now().strftime('%Y%m%d')}")
-            speaker_voice_ids[speaker_id.lower()] = voice_id
-        except Exception as e:
-            print(f"Warning: Failed to clone voice for {speaker_id}: {e}")
+        return vm.clone_voice(voice_sample_file, f"Podcast_{speaker_id}_{clone_date}")
+
+    # Each speaker's sample export (an ffmpeg encode) and voice upload are independent,
+    # so run them per speaker concurrently
+    speaker_segments = {speaker_id: segments for speaker_id, segments in samples.items() if segments}
+    with ThreadPoolExecutor(max_workers=max(len(speaker_segments), 1)) as executor:
+        clone_futures = {
+            executor.submit(export_and_clone, speaker_id, segments): speaker_id
+            for speaker_id, segments in speaker_segments.items()
+        }
+        for future in as_completed(clone_futures):
+            speaker_id = clone_futures[future]
+            try:
+                speaker_voice_ids[speaker_id.lower()] = future.result()
+            except Exception as e:
+                print(f"Warning: Failed to extract samples or clone voice for {speaker_id}: {e}")
 
     # Clean up sample files
-    for f_path in sample_files_to_delete:
+    for f_path in voice_sample_files.values():
         try:
             os.remove(f_path)
         except OSError as e:
@@ -248,10 +279,18 @@ def podcast_from_conversation(
 
     # Step 5: Generate Podcast Audio
     print("\n=== Generating Podcast Audio ===")
-    output_audio_path = write_podcast_audio(script_path, speaker_voice_ids)
+    output_audio_path, missing_lines = write_podcast_audio(
+        script_path, speaker_voice_ids, max_workers=tts_workers, return_missing_lines=True
+    )
     
-    # Step 6: Clean up generated voices
-    vm.delete_generated_voices(speaker_voice_ids)
+    # Step 6: Clean up generated voices, unless they are still needed to redo missing lines
+    if output_audio_path and not missing_lines:
+        vm.delete_generated_voices(speaker_voice_ids)
+    else:
+        print("\nSynthesis did not finish, so the cloned voices were kept:")
+        for speaker, voice_id in speaker_voice_ids.items():
+            print(f"  {speaker}: {voice_id}")
+        print(f"Re-run 'generate-podcast-audio {script_path}' with these voices, then delete them.")
 
     if output_audio_path:
         print(f"\nPodcast successfully generated: {output_audio_path}")
@@ -1,16 +1,28 @@
 
-from elevenlabs import SpeechToTextWordResponseModel
 from src.audio_processing import process_large_audio, validate_audio_filepath
-from pydub import AudioSegment
+from functools import lru_cache
+import os
 import requests
-import io
+import subprocess
+import tempfile
+from typing import TYPE_CHECKING, BinaryIO
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
 
 from src.config import AudioAIFunction, get_elevenlabs_client
-from src.transcription_processing import reconcile_speakers, write_transcription
-from src.utils import estimate_cost
+from src.transcription_processing import TranscribedWord, apply_speaker_mapping, reconcile_speakers, write_transcription
+from src.utils import call_with_rate_limit_retry, estimate_cost
+
+@lru_cache(maxsize=1)
+def _get_http_session() -> requests.Session:
+    """Shared session so direct API requests reuse pooled connections."""
+    return requests.Session()
 
 def clean_audio(input_filepath: str) -> str:
     """Clean background noise using the singleton ElevenLabs client."""
+    from pydub import AudioSegment
+    
     client = get_elevenlabs_client()
     input_format = validate_audio_filepath(input_filepath)
     audio = AudioSegment.from_file(input_filepath, format=input_format)
@@ -23,29 +35,48 @@ def clean_audio(input_filepath: str) -> str:
     if input("\nProceed with audio cleaning? [y/N]: ").lower() != 'y':
         raise ValueError("Audio cleaning cancelled by user.")
 
-    def process_chunk(chunk: AudioSegment, temp_path: str) -> bytes:
+    def process_chunk(chunk: "AudioSegment", audio_file: BinaryIO) -> bytes:
         """Process a single chunk for audio cleaning"""
         url = "https://api.elevenlabs.io/v1/audio-isolation"
-        files = {"audio": open(temp_path, 'rb')}
         headers = {"xi-api-key": client._client_wrapper._api_key}
-        response = requests.post(url, files=files, headers=headers)
-        return response.content
+        
+        def request_isolation():
+            audio_file.seek(0) # A retried upload must send the file from the start
+            response = _get_http_session().post(url, files={"audio": audio_file}, headers=headers)
+            response.raise_for_status() # Don't treat an error body as audio
+            return response.content
+        
+        return call_with_rate_limit_retry(request_isolation)
 
     cleaned_segments = process_large_audio(
         audio=audio,
         process_chunk_fn=process_chunk,
         input_filepath=input_filepath,
-        progress_prefix="Cleaning"
+        progress_prefix="Cleaning",
+        max_workers=4
     )
     
     output_filepath = input_filepath.rsplit('.', 1)[0] + '_clean.mp3'
     if len(cleaned_segments) > 1:
         print("Combining cleaned segments...")
-        combined_audio = AudioSegment.empty()
-        for segment_bytes in cleaned_segments:
-            segment = AudioSegment.from_mp3(io.BytesIO(segment_bytes))
-            combined_audio += segment
-        combined_audio.export(output_filepath, format="mp3")
+        # Every segment comes back as MP3 with the same encoding, so join them with the
+        # concat demuxer and a stream copy instead of decoding and re-encoding. Each file is
+        # demuxed separately, so per-segment ID3/Xing headers don't end up mid-stream
+        with tempfile.TemporaryDirectory() as segment_dir:
+            concat_list_path = os.path.join(segment_dir, "segments.txt")
+            with open(concat_list_path, 'w') as concat_list:
+                for i, segment_bytes in enumerate(cleaned_segments):
+                    segment_path = os.path.join(segment_dir, f"segment_{i}.mp3")
+                    with open(segment_path, 'wb') as f:
+                        f.write(segment_bytes)
+                    concat_list.write(f"file '{segment_path}'\n")
+            combine_command = [
+                AudioSegment.converter, '-y', '-hide_banner', '-loglevel', 'error',
+                '-f', 'concat', '-safe', '0', '-i', concat_list_path, '-c', 'copy', output_filepath,
+            ]
+            combined = subprocess.run(combine_command, stderr=subprocess.PIPE)
+        if combined.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {combined.returncode}: {combined.stderr.decode(errors='replace').strip()}")
     else:
         with open(output_filepath, 'wb') as f:
             f.write(cleaned_segments[0])
@@ -57,11 +88,16 @@ def transcribe_audio(
     speakers_expected: int,
     transcription_path: str = './transcription/raw_transcript.txt',
     force: bool = False,
-    return_raw_transcription: bool = False
-) -> tuple[str, list[SpeechToTextWordResponseModel]] | str:
+    return_raw_transcription: bool = False,
+    max_workers: int = 4
+) -> tuple[str, list[TranscribedWord]] | str:
     """
     Transcribe audio with speaker diarization.
+    
+    Long files are split and up to max_workers segments are transcribed concurrently.
     """
+    from pydub import AudioSegment
+    
     audio = AudioSegment.from_file(audio_path)
     client = get_elevenlabs_client()
     
@@ -76,29 +112,31 @@ def transcribe_audio(
             print("Transcription cancelled by user")
             return None, None if return_raw_transcription else None
             
-    def process_chunk(chunk: AudioSegment, temp_path: str) -> list:
+    def process_chunk(chunk: "AudioSegment", audio_file: BinaryIO) -> list:
         """Process a single chunk for transcription"""
-        transcription = client.speech_to_text.convert(
-            model_id="scribe_v1",
-            file=open(temp_path, "rb"),
-            num_speakers=speakers_expected,
-            diarize=True,
-            tag_audio_events=False
-        )
-        return transcription.words
+        def request_transcription():
+            audio_file.seek(0) # A retried upload must send the file from the start
+            return client.speech_to_text.convert(
+                model_id="scribe_v1",
+                file=audio_file,
+                num_speakers=speakers_expected,
+                diarize=True,
+                tag_audio_events=False
+            )
+        
+        return call_with_rate_limit_retry(request_transcription).words
 
-    all_chunks = []
-    for chunk in process_large_audio(
+    all_chunks = process_large_audio(
         audio=audio,
         process_chunk_fn=process_chunk,
         input_filepath=audio_path,
-        progress_prefix="Transcribing"
-    ):
-        all_chunks.append(chunk)
+        progress_prefix="Transcribing",
+        max_workers=max_workers
+    )
 
-    full_raw_transcription = reconcile_speakers(all_chunks)
-    write_transcription(full_raw_transcription, transcription_path)
+    speaker_mapping = reconcile_speakers(all_chunks)
+    write_transcription(all_chunks, speaker_mapping, transcription_path)
     
     if return_raw_transcription:
-        return transcription_path, full_raw_transcription
+        return transcription_path, list(apply_speaker_mapping(all_chunks, speaker_mapping))
     return transcription_path
\ No newline at end of file
@@ -1,19 +1,89 @@
-from typing import Dict
+from typing import TYPE_CHECKING, Dict
 from datetime import datetime
-import io
-import re
+import hashlib
+import json
 import os
-from pydub import AudioSegment
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+if TYPE_CHECKING:
+    import numpy as np
 
 # Import the singleton client getter
 from .config import get_elevenlabs_client
+from .utils import call_with_rate_limit_retry, prune_cache_dir, write_file_atomic
+
+# Raw 16-bit little-endian mono PCM, as returned for the "pcm_24000" output format.
+# pcm_44100 requires the Independent Publisher tier or above; 24 kHz is available on every plan
+TTS_OUTPUT_FORMAT = "pcm_24000"
+TTS_FRAME_RATE = 24000
+TTS_SAMPLE_WIDTH = 2
+TTS_CHANNELS = 1
+TTS_MODEL_ID = "eleven_multilingual_v2"
+TTS_CACHE_DIR = ".tts_cache"
+# Least recently used lines are evicted past this size (about 3 hours of 24 kHz PCM)
+TTS_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Concurrent TTS requests; ElevenLabs plans allow between 2 (free) and 10+ at once,
+# and requests over the limit are rejected with 429 and retried with backoff
+TTS_MAX_WORKERS = 3
+
+# Request options that are the same for every line
+TTS_REQUEST_OPTIONS = {
+    "model_id": TTS_MODEL_ID,
+    "output_format": TTS_OUTPUT_FORMAT,
+}
+
+
+def _tts_cache_path(cache_dir: str, voice_id: str, text: str, request_options_key: str) -> str:
+    """Path of the cached PCM for a line, keyed on everything that affects the synthesized audio."""
+    key = hashlib.sha1(f"{voice_id}|{text}|{request_options_key}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}.pcm")
+
+
+def _encode_podcast(pcm_parts: list, output_path: str) -> str | None:
+    """Encode the podcast's PCM parts to an MP3 at output_path, returning None if ffmpeg fails."""
+    print("\nEncoding podcast audio...")
+    from pydub import AudioSegment
+    
+    # Stream the PCM parts straight into one ffmpeg encode rather than building the whole track in memory
+    encoder_command = [
+        AudioSegment.converter, '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 's16le', '-ar', str(TTS_FRAME_RATE), '-ac', str(TTS_CHANNELS), '-i', 'pipe:0',
+        '-f', 'mp3', output_path,
+    ]
+    
+    # Export the final audio
+    try:
+        encoder = subprocess.Popen(encoder_command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for pcm in pcm_parts:
+                encoder.stdin.write(pcm)
+        except BrokenPipeError:
+            pass # ffmpeg exited early; its error is reported below
+        _, encoder_errors = encoder.communicate()
+        if encoder.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {encoder.returncode}: {encoder_errors.decode(errors='replace').strip()}")
+        print(f"\nPodcast audio saved to: {output_path}")
+        return output_path
+    except Exception as e:
+        print(f"\nError exporting final audio: {e}")
+        return None
 
 
-def write_podcast_audio(script_path: str, speaker_voice_ids: Dict[str, str], output_path: str | None = None):
+def write_podcast_audio(script_path: str, speaker_voice_ids: Dict[str, str], output_path: str | None = None, max_workers: int = TTS_MAX_WORKERS, cache_dir: str | None = None, optimize_streaming_latency: int | None = None, return_missing_lines: bool = False):
     """
     Write the podcast audio to a file using the singleton client.
     Generates an output path if none is provided.
+    At most max_workers TTS requests are in flight at once, to stay within ElevenLabs concurrency limits.
+    Lines that fail to synthesize are left out and listed once all lines have been tried; with
+    return_missing_lines the texts of those lines are returned alongside the output path.
+    If cache_dir is given (e.g. TTS_CACHE_DIR), synthesized lines are cached there so re-runs of an edited
+    script only pay for changed lines. Leave it unset for voices that are deleted after the run.
+    optimize_streaming_latency (0-4) trades audio quality for time-to-first-byte; each line is read
+    whole before use, so it is off by default.
     """
+    import numpy as np
+    
     if output_path is None:
         output_dir = os.path.dirname(script_path)
         base_name = os.path.basename(script_path).rsplit('.', 1)[0]
@@ -21,80 +91,120 @@ def write_podcast_audio(script_path: str, speaker_voice_ids: Dict[str, str], out
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
     client = get_elevenlabs_client()
-    silence = AudioSegment.silent(duration=500)
-    audio_segments = [silence]
+    request_options = dict(TTS_REQUEST_OPTIONS)
+    if optimize_streaming_latency:
+        request_options["optimize_streaming_latency"] = optimize_streaming_latency
+    # Serialized once for the cache key
+    request_options_key = json.dumps(request_options, sort_keys=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    silence = np.zeros(TTS_FRAME_RATE * TTS_CHANNELS // 2, dtype=np.int16) # 500ms
 
+    # Parse the whole script first so repeated lines are only synthesized once
+    script_lines = []
     with open(script_path, 'r') as f:
-        # Count total lines for progress tracking
-        all_lines = f.readlines()
-        f.seek(0)
-        total_lines = len([line for line in all_lines if line.strip()])
-        processed_lines = 0
-        start_time = datetime.now()
-        
         for line in f:
-            if line.strip():
-                processed_lines += 1
-                if processed_lines > 1:
-                    elapsed_time = (datetime.now() - start_time).total_seconds()
-                    time_per_line = elapsed_time / processed_lines
-                    remaining_lines = total_lines - processed_lines
-                    estimated_time_remaining = remaining_lines * time_per_line
-                    print(f"Progress: {processed_lines}/{total_lines} lines ({processed_lines/total_lines*100:.1f}%) - Est. remaining time: {estimated_time_remaining:.1f} seconds", end="\r")
-            
             line = line.strip()
             if not line:
                 continue
             
-            # Split the speaker name from the line
-            match = re.match(r'^([^:]+):\s*(.*)', line)
-            if not match:
-                print(f"\nSkipping improperly formatted line: {line}")
+            # Split the speaker name from the line ("SPEAKER: text")
+            speaker, sep, text = line.partition(':')
+            speaker = speaker.strip()
+            if not sep or not speaker:
+                print(f"Skipping improperly formatted line: {line}")
+                continue
+            
+            text = text.lstrip()
+            if not text:
+                print(f"Skipping line with no text: {line}")
                 continue
             
-            speaker, text = match.groups()
             speaker_key = speaker.lower()
             if speaker_key not in speaker_voice_ids:
-                print(f"\nWarning: No voice ID for speaker {speaker} (key: {speaker_key}), skipping line")
+                print(f"Warning: No voice ID for speaker {speaker} (key: {speaker_key}), skipping line")
                 continue
             
-            voice_id = speaker_voice_ids[speaker_key]
+            script_lines.append((speaker_voice_ids[speaker_key], text))
+
+    def request_line_audio(voice_id: str, text: str) -> bytearray:
+        """Request a line from the API and read the whole streamed response"""
+        audio_stream = client.text_to_speech.convert(text=text, voice_id=voice_id, **request_options)
+        # Append chunks as they arrive so each one can be freed immediately
+        audio_bytes = bytearray()
+        for chunk in audio_stream:
+            audio_bytes.extend(chunk)
+        return audio_bytes
+
+    def synthesize_line(voice_id: str, text: str) -> "np.ndarray | None":
+        """Generate the PCM samples for a single line"""
+        cache_path = _tts_cache_path(cache_dir, voice_id, text, request_options_key) if cache_dir else None
+        audio_bytes = None
+        if cache_path:
+            try:
+                with open(cache_path, 'rb') as f:
+                    audio_bytes = f.read()
+                os.utime(cache_path) # Mark as recently used for eviction
+            except OSError:
+                pass
+        
+        if not audio_bytes:
+            audio_bytes = call_with_rate_limit_retry(request_line_audio, voice_id, text)
+            if not audio_bytes:
+                print(f"\nWarning: Empty audio generated for line: {text}")
+                return None
             
-            # Generate audio for this line
+            if cache_path:
+                write_file_atomic(cache_path, audio_bytes)
+        
+        # PCM needs no decoding; segments are streamed to a single encode at the end
+        sample_count = len(audio_bytes) // TTS_SAMPLE_WIDTH
+        return np.frombuffer(audio_bytes, dtype=np.int16, count=sample_count)
+
+    # Identical (voice, text) pairs share one TTS call
+    unique_lines = list(dict.fromkeys(script_lines))
+    total_lines = len(unique_lines)
+    if total_lines < len(script_lines):
+        print(f"Synthesizing {total_lines} unique lines for {len(script_lines)} script lines")
+    
+    # Lines are independent TTS requests, so dispatch them concurrently
+    synthesized = {}
+    start_time = datetime.now()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(synthesize_line, voice_id, text): (voice_id, text) for voice_id, text in unique_lines}
+        for processed_lines, future in enumerate(as_completed(futures), start=1):
+            line_key = futures[future]
             try:
-                audio_bytes = client.text_to_speech.convert(
-                    text=text,
-                    voice_id=voice_id,
-                    model_id="eleven_multilingual_v2",
-                    output_format="mp3_44100_128",
-                )
-                audio_bytes = b''.join(audio_bytes)
-                
-                if not audio_bytes:
-                    print(f"\nWarning: Empty audio generated for line: {line}")
-                    continue
-                    
-                audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
-                processed_segment = audio_segment + silence
-                audio_segments.append(processed_segment)
-                
+                samples = future.result()
+                if samples is not None:
+                    synthesized[line_key] = samples
             except Exception as e:
-                print(f"\nError generating audio for line: {line} - {e}")
+                print(f"\nError generating audio for line: {line_key[1]} - {e}")
+            
+            elapsed_time = (datetime.now() - start_time).total_seconds()
+            time_per_line = elapsed_time / processed_lines
+            remaining_lines = total_lines - processed_lines
+            estimated_time_remaining = remaining_lines * time_per_line
+            print(f"Progress: {processed_lines}/{total_lines} lines ({processed_lines/total_lines*100:.1f}%) - Est. remaining time: {estimated_time_remaining:.1f} seconds", end="\r")
     
-    if len(audio_segments) <= 1:
-        print("\nNo audio segments were generated.")
-        return None
+    if cache_dir:
+        prune_cache_dir(cache_dir, '.pcm', TTS_CACHE_MAX_BYTES)
     
-    print("\nCombining audio segments...")
-    final_audio = AudioSegment.empty()
-    for segment in audio_segments:
-        final_audio += segment
+    missing_lines = [text for voice_id, text in unique_lines if (voice_id, text) not in synthesized]
+    if missing_lines:
+        print(f"\n{len(missing_lines)} of {total_lines} lines could not be synthesized and are missing from the podcast:")
+        for text in missing_lines:
+            print(f"  - {text}")
     
-    # Export the final audio
-    try:
-        final_audio.export(output_path, format="mp3")
-        print(f"\nPodcast audio saved to: {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"\nError exporting final audio: {e}")
-        return None
+    pcm_parts = [silence]
+    for line_key in script_lines:
+        if line_key in synthesized:
+            pcm_parts.append(synthesized[line_key])
+            pcm_parts.append(silence)
+    
+    if len(pcm_parts) <= 1:
+        print("\nNo audio segments were generated.")
+        output_path = None
+    else:
+        output_path = _encode_podcast(pcm_parts, output_path)
+    return (output_path, missing_lines) if return_missing_lines else output_path
@@ -1,5 +1,12 @@
+import io
 import os
-from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+SUPPORTED_AUDIO_FORMATS = frozenset({'mp3', 'wav', 'ogg', 'm4a', 'mp4', 'wma', 'aac', 'flac'})
 
 # Moved from helpers/audio_helpers.py
 def validate_audio_filepath(filepath: str) -> str:
@@ -15,77 +22,117 @@ def validate_audio_filepath(filepath: str) -> str:
     Raises:
         ValueError: If file extension is not a recognized audio format
     """
-    supported_formats = {'mp3', 'wav', 'ogg', 'm4a', 'mp4', 'wma', 'aac', 'flac'}
-    
-    try:
-        file_format = filepath.split('.')[-1].lower()
-    except IndexError:
+    file_format = os.path.splitext(filepath)[1].lstrip('.').lower()
+    if not file_format:
         raise ValueError(f"Invalid filepath: {filepath}. No file extension found.")
         
-    if file_format not in supported_formats:
+    if file_format not in SUPPORTED_AUDIO_FORMATS:
         raise ValueError(f"File '{filepath}' has unsupported format '.{file_format}'. "
-                        f"Supported formats are: {', '.join(supported_formats)}")
+                        f"Supported formats are: {', '.join(sorted(SUPPORTED_AUDIO_FORMATS))}")
                         
     return file_format
 
+def get_audio_duration_ms(filepath: str) -> int:
+    """
+    Get the duration of an audio file without decoding it
+    
+    Reads the container metadata with ffprobe and only falls back to a full
+    decode if no duration is reported.
+    
+    Args:
+        filepath: Full path to audio file
+        
+    Returns:
+        int: Duration in milliseconds
+    """
+    from pydub import AudioSegment
+    from pydub.utils import mediainfo
+    
+    duration_sec = mediainfo(filepath).get('duration')
+    try:
+        return int(float(duration_sec) * 1000)
+    except (TypeError, ValueError):
+        return len(AudioSegment.from_file(filepath))
+
 # Moved from helpers/audio_helpers.py
 def process_large_audio(
-    audio: AudioSegment,
+    audio: "AudioSegment",
     process_chunk_fn: callable,
     max_length_sec: int = 3500,
     input_filepath: str = None,
-    progress_prefix: str = "Processing"
+    progress_prefix: str = "Processing",
+    max_workers: int = 4
 ) -> list:
     """
     Split large audio files into chunks, process each chunk, and return list of results.
     
     Args:
         audio: AudioSegment to process
-        process_chunk_fn: Function that takes (chunk: AudioSegment, temp_path: str) and returns result
+        process_chunk_fn: Function that takes (chunk: AudioSegment, audio_file: BinaryIO) and returns result.
+            audio_file is the encoded chunk, open for reading
         max_length_sec: Maximum length in seconds for each chunk
-        input_filepath: Used to generate temporary filenames
+        input_filepath: Source file, read directly when no split is needed; its extension sets the chunk format
         progress_prefix: Prefix for progress messages
+        max_workers: Number of chunks processed concurrently. Keep it within the API plan's concurrent
+            request limit. process_chunk_fn must be thread-safe unless this is 1
         
     Returns:
-        list: List of results from processing each chunk
+        list: List of results from processing each chunk, in chunk order
     """
     max_length_ms = max_length_sec * 1000
-    results = []
+    export_format = os.path.splitext(input_filepath)[1].lstrip('.') if input_filepath else "mp3"
     
-    try:
-        if len(audio) > max_length_ms:
-            print(f"{progress_prefix} exceeds maximum length, splitting into segments...")
-            # Split into segments
-            num_segments = (len(audio) + max_length_ms - 1) // max_length_ms
-            for i in range(num_segments):
-                print(f"{progress_prefix} segment {i+1} of {num_segments}...")
-                start_ms = i * max_length_ms
-                end_ms = min((i + 1) * max_length_ms, len(audio))
-                segment = audio[start_ms:end_ms]
-                
-                temp_filepath = None
-                if input_filepath:
-                    base, ext = os.path.splitext(input_filepath)
-                    temp_filepath = f"{base}_temp_{i}{ext}" # Use original extension
-                    segment.export(temp_filepath, format=ext.lstrip('.'))
-                
-                try:
-                    # Process segment
-                    result = process_chunk_fn(segment, temp_filepath)
-                    results.append(result)
-                finally:
-                    # Clean up temp file
-                    if temp_filepath and os.path.exists(temp_filepath):
-                        os.remove(temp_filepath)
-        else:
-            # Process entire file if under limit
-            print(f"{progress_prefix} entire file...")
-            result = process_chunk_fn(audio, input_filepath)
-            results.append(result)
-            
-    except Exception as e:
-        if temp_filepath and os.path.exists(temp_filepath):
-             os.remove(temp_filepath)
-        raise e
+    def export_in_memory(segment: "AudioSegment", name: str) -> io.BytesIO:
+        """Encode a segment into an in-memory file instead of a temp file on disk"""
+        audio_file = io.BytesIO()
+        segment.export(audio_file, format=export_format)
+        audio_file.seek(0)
+        audio_file.name = f"{name}.{export_format}" # Upload filename for multipart requests
+        return audio_file
+    
+    if len(audio) <= max_length_ms:
+        # Process entire file if under limit
+        print(f"{progress_prefix} entire file...")
+        if input_filepath:
+            with open(input_filepath, 'rb') as audio_file:
+                return [process_chunk_fn(audio, audio_file)]
+        return [process_chunk_fn(audio, export_in_memory(audio, "audio"))]
+    
+    print(f"{progress_prefix} exceeds maximum length, splitting into segments...")
+    num_segments = (len(audio) + max_length_ms - 1) // max_length_ms
+    
+    def process_segment(i: int):
+        print(f"{progress_prefix} segment {i+1} of {num_segments}...")
+        start_ms = i * max_length_ms
+        end_ms = min((i + 1) * max_length_ms, len(audio))
+        segment = audio[start_ms:end_ms]
+        
+        # Process segment
+        return process_chunk_fn(segment, export_in_memory(segment, f"segment_{i}"))
+    
+    # Segments are independent API calls, so overlap them; map keeps results in order
+    with ThreadPoolExecutor(max_workers=min(max_workers, num_segments)) as executor:
+        return list(executor.map(process_segment, range(num_segments)))
+
+def concatenate_segments(segments: list["AudioSegment"]) -> "AudioSegment":
+    """
+    Concatenate audio segments with a single copy of the raw PCM data
+    
+    Chained `+=` copies the whole accumulated buffer on every append, which is
+    quadratic in the number of segments. Segments are first brought to the
+    highest frame rate, sample width and channel count among them in one pass,
+    the same way pydub syncs the two sides of a `+`.
+    
+    Args:
+        segments: AudioSegments to join, in order
+        
+    Returns:
+        AudioSegment: The combined audio
+    """
+    from pydub import AudioSegment
+    
+    if not segments:
+        return AudioSegment.empty()
     
-    return results
+    synced = AudioSegment._sync(*segments)
+    return synced[0]._spawn(b"".join(segment.raw_data for segment in synced))
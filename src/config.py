@@ -1,7 +1,12 @@
 import os
+import sys
 import getpass
-from elevenlabs import ElevenLabs
 from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from elevenlabs import ElevenLabs
+    from google import genai
 
 # --- Constants ---
 WORDS_PER_MINUTE = 150
@@ -14,13 +19,15 @@ class AudioAIFunction(Enum):
     TEXT_TO_SPEECH = "text_to_speech"
 
 # --- API Key Management ---
-def load_api_keys():
-    if not os.environ.get("ANTHROPIC_API_KEY"):
-        os.environ["ANTHROPIC_API_KEY"] = getpass.getpass("Enter API key for Anthropic: ")
-    if not os.environ.get("GEMINI_API_KEY"):
-        os.environ["GEMINI_API_KEY"] = getpass.getpass("Enter API key for Gemini: ")
-    if not os.environ.get("ELEVENLABS_API_KEY"):
-        os.environ["ELEVENLABS_API_KEY"] = getpass.getpass("Enter API key for ElevenLabs: ")
+def load_api_key(env_var: str, service_name: str):
+    """
+    Prompt for an API key missing from the environment.
+    
+    Only prompts when attached to a terminal; otherwise the key must already be set,
+    and the caller raises if it is not.
+    """
+    if not os.environ.get(env_var) and sys.stdin.isatty():
+        os.environ[env_var] = getpass.getpass(f"Enter API key for {service_name}: ")
 
 # --- Singletons ---
 class ElevenLabsClientSingleton:
@@ -29,22 +36,45 @@ class ElevenLabsClientSingleton:
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(ElevenLabsClientSingleton, cls).__new__(cls)
-            load_api_keys()
+            load_api_key("ELEVENLABS_API_KEY", "ElevenLabs")
             if not os.environ.get("ELEVENLABS_API_KEY"):
                  raise ValueError("ELEVENLABS_API_KEY environment variable not set.")
+            from elevenlabs import ElevenLabs # Deferred: heavy import only needed once a client is used
             cls._client = ElevenLabs()
+            # Only publish the instance once the client exists, so a failed attempt can be retried
+            cls._instance = super(ElevenLabsClientSingleton, cls).__new__(cls)
         return cls._instance
 
     @property
-    def client(self) -> ElevenLabs:
+    def client(self) -> "ElevenLabs":
         if self._client is None:
             raise RuntimeError("ElevenLabs client has not been initialized.")
         return self._client
 
-# Function to easily get the client instance
-def get_elevenlabs_client() -> ElevenLabs:
+class GeminiClientSingleton:
+    _instance = None
+    _client = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            load_api_key("GEMINI_API_KEY", "Gemini")
+            if not os.environ.get("GEMINI_API_KEY"):
+                 raise ValueError("GEMINI_API_KEY environment variable not set.")
+            from google import genai # Deferred: heavy import only needed once a client is used
+            cls._client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+            # Only publish the instance once the client exists, so a failed attempt can be retried
+            cls._instance = super(GeminiClientSingleton, cls).__new__(cls)
+        return cls._instance
+
+    @property
+    def client(self) -> "genai.Client":
+        if self._client is None:
+            raise RuntimeError("Gemini client has not been initialized.")
+        return self._client
+
+# Functions to easily get the client instances
+def get_elevenlabs_client() -> "ElevenLabs":
     return ElevenLabsClientSingleton().client
 
-# Load keys on module import
-load_api_keys()
+def get_gemini_client() -> "genai.Client":
+    return GeminiClientSingleton().client
@@ -1,28 +1,85 @@
+from functools import lru_cache
+import hashlib
+import json
 import os
-from pydantic import BaseModel
-from typing import Type, List, Dict, Any
-from google import genai
+import time
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Callable, Type, List, Dict, Any
 
-# Ensure API keys are loaded (config takes care of this)
-from .config import load_api_keys
-load_api_keys()
+# The Gemini API key is loaded when the client singleton is first created
+from .config import get_gemini_client
+from .utils import prune_cache_dir, write_file_atomic
+
+LLM_MODEL = "gemini-2.0-flash"
+LLM_CACHE_DIR = ".llm_cache"
+# Oldest responses are evicted past this size
+LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024
 
 class LLMService:
     """Handles interactions with the Google Gemini LLM."""
-    def __init__(self):
-        """Initializes the Gemini client."""
-        if not os.environ.get("GEMINI_API_KEY"):
-            raise ValueError("GEMINI_API_KEY environment variable not set.")
-        
-        # Instantiate the client directly
-        self.client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
-        
-    def generate_text(self, prompt: str) -> str:
-        """Generates plain text based on a user prompt."""
+    def __init__(self, cache_enabled: bool = True, ttl: int = 86400, cache_dir: str = LLM_CACHE_DIR):
+        """
+        Uses the singleton Gemini client so its connection pool is shared.
+
+        Args:
+            cache_enabled: Reuse responses for prompts already sent to the model
+            ttl: Seconds a cached response stays valid
+            cache_dir: Directory holding cached responses
+        """
+        self.client = get_gemini_client()
+        self.cache_enabled = cache_enabled
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.stats = {"hits": 0, "misses": 0}
+        if cache_enabled:
+            # Expired entries are never read again, so drop them along with any overflow
+            prune_cache_dir(cache_dir, '.txt', LLM_CACHE_MAX_BYTES, max_age_sec=ttl)
+
+    def _cache_path(self, prompt: str, schema: dict | None = None) -> str:
+        """Path of the cache entry for an exact (model, prompt, schema) combination."""
+        key_data = json.dumps({"model": LLM_MODEL, "prompt": prompt, "schema": schema}, sort_keys=True)
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(key_data.encode()).hexdigest()}.txt")
+
+    def _read_cache(self, cache_path: str, parse: Callable[[str], Any] = str) -> Any | None:
+        """
+        Return the cached response passed through parse, or None if caching is off or the
+        entry is missing, expired or fails to parse.
+        """
+        if not self.cache_enabled:
+            return None
+        try:
+            if time.time() - os.path.getmtime(cache_path) < self.ttl:
+                with open(cache_path, 'r') as f:
+                    cached = parse(f.read())
+                self.stats["hits"] += 1
+                return cached
+        except (OSError, ValidationError):
+            pass
+        self.stats["misses"] += 1
+        return None
+
+    def _write_cache(self, cache_path: str, text: str | None):
+        if not self.cache_enabled or not text:
+            return
+        # Responses can quote the conversation, so keep them private to the user
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        write_file_atomic(cache_path, text)
+
+    def generate_text(self, prompt: str, use_cache: bool = True) -> str:
+        """
+        Generates plain text based on a user prompt.
+
+        With use_cache=False a fresh response is requested and replaces any cached one.
+        """
+        cache_path = self._cache_path(prompt)
+        cached_text = self._read_cache(cache_path) if use_cache else None
+        if cached_text is not None:
+            return cached_text
         try:
             # Use the initialized genai_model
             contents = [prompt]
-            response = self.client.models.generate_content(model="gemini-2.0-flash", contents=contents)
+            response = self.client.models.generate_content(model=LLM_MODEL, contents=contents)
+            self._write_cache(cache_path, response.text)
             return response.text
         except Exception as e:
             print(f"Error during LLM text generation: {e}")
@@ -30,12 +87,24 @@ class LLMService:
 
     def generate_structured(self, prompt: str, response_model: Type[BaseModel]  ) -> Type[BaseModel] | None:
         """Generates structured output matching the provided Pydantic model."""
+        adapter = TypeAdapter(response_model)
+        cache_path = self._cache_path(prompt, schema=adapter.json_schema())
+        cached = self._read_cache(cache_path, parse=adapter.validate_json)
+        if cached is not None:
+            return cached
         response = self.client.models.generate_content(
-            model='gemini-2.0-flash',
+            model=LLM_MODEL,
             contents=prompt,
             config={
                 'response_mime_type': 'application/json',
                 'response_schema': response_model,
             },
         )
-        return response.parsed
\ No newline at end of file
+        if response.parsed is not None:
+            self._write_cache(cache_path, response.text)
+        return response.parsed
+
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Return the process-wide LLMService instance."""
+    return LLMService()
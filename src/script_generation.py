@@ -4,10 +4,11 @@ from typing import List
 
 # Moved from client.py
 from src.config import WORDS_PER_MINUTE # Import from config
-from src.llm_service import LLMService # Import the new service
+from src.llm_service import get_llm_service # Import the new service
+from src.utils import read_prompt
 
 
-def generate_script(transcription_path: str, length_minutes: int, audience: str = "general", type: str = "discussion") -> str:
+def generate_script(transcription_path: str, length_minutes: int, audience: str = "general", type: str = "discussion", use_cache: bool = True) -> str:
     """
     Generate a script from a transcription using LLMService.
     
@@ -16,6 +17,7 @@ def generate_script(transcription_path: str, length_minutes: int, audience: str
         length_minutes: Target length in minutes
         audience: Target audience for the script
         type: Type of podcast (discussion, interview, etc.)
+        use_cache: Reuse a cached script for the same prompt; False always asks the LLM for a new one
     
     Returns:
         str: Path to the generated script file
@@ -25,11 +27,7 @@ def generate_script(transcription_path: str, length_minutes: int, audience: str
         transcription = f.read()
 
     # Read prompt template
-    prompt_path = 'prompts/script_generation.md'
-    if not os.path.exists(prompt_path):
-        raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
-    with open(prompt_path, 'r') as f:
-        prompt_template = f.read()
+    prompt_template = read_prompt('prompts/script_generation.md')
     
     # Calculate word count target
     word_count = length_minutes * WORDS_PER_MINUTE
@@ -43,7 +41,7 @@ def generate_script(transcription_path: str, length_minutes: int, audience: str
     )
     
     # Use LLMService for generation
-    llm = LLMService() # Initialize the service
+    llm = get_llm_service()
     
     # Construct the full prompt for the LLM
     full_prompt = f"{prompt}\n\nTRANSCRIPT:\n{transcription}\n\nSCRIPT:"
@@ -52,7 +50,7 @@ def generate_script(transcription_path: str, length_minutes: int, audience: str
     # max_tokens_to_generate = max(1000, int(word_count * 1.5))
     
     # Generate script text using the service (removed max_tokens)
-    script_content = llm.generate_text(prompt=full_prompt)
+    script_content = llm.generate_text(prompt=full_prompt, use_cache=use_cache)
     
     if not script_content:
          print("Warning: LLM script generation returned empty content.")
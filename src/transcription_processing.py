@@ -1,41 +1,46 @@
-from typing import List, TypedDict, cast, Type
-from elevenlabs import SpeechToTextWordResponseModel
+from typing import Iterator, List, NamedTuple, TypedDict, cast, Type
 import os # Added for file path handling
-from pydantic import BaseModel # Import BaseModel
+from itertools import groupby
+from operator import attrgetter, itemgetter
+from pydantic import BaseModel, Field # Import BaseModel
 
 # Import the LLM service
-from .llm_service import LLMService 
+from .llm_service import get_llm_service
+from .utils import read_prompt
 
 # Define SpeakerMapping first, inheriting from BaseModel
+# Single-letter JSON keys keep the model's output short; one entry is generated per speaker per chunk
 class SpeakerMapping(BaseModel):
-    chunk_number: int
-    original_id: str
-    global_name: str
+    chunk_number: int = Field(alias="c", description="1-based chunk number")
+    original_id: str = Field(alias="o", description="Speaker ID as it appears in the chunk")
+    global_name: str = Field(alias="g", description="Consistent speaker name across all chunks")
+
+class TranscribedWord(NamedTuple):
+    """A transcribed word with its speaker renamed to the reconciled global name."""
+    text: str
+    start: float
+    end: float
+    speaker_id: str | None
+    type: str
 
 def format_chunk_for_llm(chunk_words: list, chunk_num: int) -> str:
     """
     Convert a list of word objects into a formatted chunk transcript
     """
-    current_speaker = None
-    current_text = []
     chunk_lines = [f"CHUNK {chunk_num}:"]
-    
-    for word in chunk_words:
-        if word.speaker_id != current_speaker:
-            if current_speaker and current_text:
-                chunk_lines.append(f"{current_speaker}: {' '.join(current_text).strip()}")
-            current_speaker = word.speaker_id
-            current_text = [word.text.strip()]
-        else:
-            current_text.append(word.text.strip())
-    
-    if current_speaker and current_text:
-        chunk_lines.append(f"{current_speaker}: {' '.join(current_text).strip()}")
+    # Consecutive words from the same speaker form one line
+    for speaker, words in groupby(chunk_words, key=attrgetter('speaker_id')):
+        if speaker:
+            chunk_lines.append(f"{speaker}: {' '.join(word.text.strip() for word in words).strip()}")
     
     return "\n".join(chunk_lines)
 
-def reconcile_speakers(chunks: list) -> list:
-    """Reconcile speaker identities using LLMService."""
+def reconcile_speakers(chunks: list) -> list[dict[str, str]]:
+    """
+    Reconcile speaker identities using LLMService.
+    
+    Returns one mapping per chunk from the chunk-local speaker_id to the global speaker name.
+    """
     # Format all chunks for LLM
     all_chunk_texts = []
     for i, chunk in enumerate(chunks):
@@ -43,11 +48,7 @@ def reconcile_speakers(chunks: list) -> list:
         all_chunk_texts.append(chunk_text)
     
     # Read prompt template
-    prompt_path = 'prompts/speaker_reconciliation.md'
-    if not os.path.exists(prompt_path):
-        raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
-    with open(prompt_path, 'r') as f:
-        prompt_template = f.read()
+    prompt_template = read_prompt('prompts/speaker_reconciliation.md')
     
     # Combine all chunks into single input
     chunks_text = "\n\n".join(all_chunk_texts)
@@ -56,7 +57,7 @@ def reconcile_speakers(chunks: list) -> list:
     prompt = prompt_template.format(chunks=chunks_text)
     
     # Use LLMService for structured generation
-    llm = LLMService() # Initialize service
+    llm = get_llm_service()
     response = llm.generate_structured(prompt=prompt, response_model=list[SpeakerMapping])
     
         
@@ -68,41 +69,45 @@ def reconcile_speakers(chunks: list) -> list:
             print(f"Warning: Chunk number {entry.chunk_number} out of bounds.")
             continue
         global_mapping[entry.chunk_number-1][entry.original_id] = entry.global_name
+    return global_mapping
 
-    # Combine all chunks into one transcription
-    reconciled_words = []
+def apply_speaker_mapping(chunks: list, speaker_mapping: list[dict[str, str]]) -> Iterator[TranscribedWord]:
+    """
+    Lazily combine all chunks into one transcription, renaming speakers to their global names.
+    
+    Yields plain tuples rather than re-validated SDK models, since only the fields are needed.
+    """
     for chunk_num, chunk in enumerate(chunks):
+        chunk_mapping = speaker_mapping[chunk_num]
         for word in chunk:
-            # Convert original speaker_id to global name using mapping
-            global_speaker = global_mapping[chunk_num].get(word.speaker_id)
-            # Ensure all required fields are present
-            reconciled_word = SpeechToTextWordResponseModel(
+            yield TranscribedWord(
                 text=word.text,
-                start=getattr(word, 'start', 0.0), # Provide default if missing
-                end=getattr(word, 'end', 0.0),   # Provide default if missing
-                speaker_id=global_speaker,
+                start=getattr(word, 'start', None) or 0.0, # Provide default if missing
+                end=getattr(word, 'end', None) or 0.0,   # Provide default if missing
+                # Convert original speaker_id to global name using mapping
+                speaker_id=chunk_mapping.get(word.speaker_id),
                 type=getattr(word, 'type', 'word') # Provide default if missing
             )
-            reconciled_words.append(reconciled_word)
-    return reconciled_words
 
 # Moved from helpers/helpers.py
-def write_transcription(all_words: list, output_path: str):
-    """Write transcription words to file with proper formatting"""
+def write_transcription(chunks: list, speaker_mapping: list[dict[str, str]], output_path: str):
+    """
+    Write transcription words to file with proper formatting.
+    
+    Speakers are renamed with the per-chunk mapping while writing, so no reconciled
+    copy of the words is needed.
+    """
     os.makedirs(os.path.dirname(output_path), exist_ok=True) # Ensure directory exists
-    # Write final transcript using global mapping
+    mapped_words = (
+        (speaker_mapping[chunk_num].get(word.speaker_id), word.text)
+        for chunk_num, chunk in enumerate(chunks)
+        for word in chunk
+    )
+    transcript_lines = [
+        f"{speaker}: {' '.join(text.strip() for _, text in words).replace('  ', ' ')}\n"
+        for speaker, words in groupby(mapped_words, key=itemgetter(0))
+        if speaker
+    ]
+    # Write final transcript using global mapping, in a single write
     with open(output_path, 'w') as f:
-        current_speaker = None
-        current_text = []
-        
-        for word in all_words:
-            if word.speaker_id != current_speaker:
-                if current_speaker and current_text:
-                    f.write(f"{current_speaker}: {' '.join(current_text).replace('  ', ' ')}\n")
-                current_speaker = word.speaker_id
-                current_text = [word.text.strip()]
-            else:
-                current_text.append(word.text.strip())
-        
-        if current_speaker and current_text:
-            f.write(f"{current_speaker}: {' '.join(current_text).replace('  ', ' ')}\n")
+        f.write("".join(transcript_lines))
@@ -1,4 +1,9 @@
+from contextlib import suppress
 from datetime import datetime
+from functools import lru_cache
+import os
+import tempfile
+import time
 
 def display_available_voices(voices: list):
     """Display available voices in a formatted table"""
@@ -14,10 +19,94 @@ def display_available_voices(voices: list):
         table += f"{voice.name:<30} {created_at:<20}\n"
     print(table)
 
+def read_prompt(prompt_path: str) -> str:
+    """Read a prompt template, reusing the cached copy until the file is modified"""
+    if not os.path.exists(prompt_path):
+        raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
+    return _read_prompt_cached(prompt_path, os.path.getmtime(prompt_path))
+
+@lru_cache(maxsize=16)
+def _read_prompt_cached(prompt_path: str, mtime: float) -> str:
+    with open(prompt_path, 'r') as f:
+        return f.read()
+
+def write_file_atomic(path: str, data: bytes | str):
+    """Write data through a temp file in the same directory, so an interrupted write never leaves a partial file at path"""
+    mode = 'w' if isinstance(data, str) else 'wb'
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def prune_cache_dir(cache_dir: str, suffix: str, max_bytes: int, max_age_sec: float | None = None):
+    """
+    Delete cache entries (files ending in suffix) older than max_age_sec, then the least
+    recently modified ones until the rest fit in max_bytes.
+    """
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    
+    expired_before = time.time() - max_age_sec if max_age_sec is not None else None
+    total_bytes = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if total_bytes <= max_bytes and (expired_before is None or mtime >= expired_before):
+            break
+        with suppress(OSError):
+            os.remove(path)
+        total_bytes -= size
+
+def call_with_rate_limit_retry(fn: callable, *args, max_retries: int = 5, base_delay_sec: float = 1.0, **kwargs):
+    """
+    Call fn, retrying with exponential backoff while the API rejects it with HTTP 429.
+    
+    ElevenLabs answers 429 once a plan's concurrent request limit is reached, and the
+    SDK does not retry it, so concurrent callers need to back off themselves.
+    
+    Args:
+        fn: Function making the API request; it must consume the whole response so a
+            streamed 429 is raised inside the retry loop
+        max_retries: Retries after the first attempt before the error is re-raised
+        base_delay_sec: Delay before the first retry, doubled on each later one
+        
+    Returns:
+        The return value of fn
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            # SDK errors carry status_code; requests.HTTPError carries it on its response
+            status_code = getattr(e, 'status_code', None) or getattr(getattr(e, 'response', None), 'status_code', None)
+            if status_code != 429 or attempt == max_retries:
+                raise
+            time.sleep(base_delay_sec * 2 ** attempt)
+
 # Moved estimate_cost here from client.py
 # Import AudioAIFunction from config
 from .config import AudioAIFunction
 
+MS_PER_MINUTE = 60 * 1000
+
+# USD per millisecond of audio for each ElevenLabs operation
+COST_PER_MS = {
+    AudioAIFunction.CLEAN: 1000 * 5 / 30000 / MS_PER_MINUTE,
+    AudioAIFunction.SPEECH_TO_TEXT: 0.40 / (60 * MS_PER_MINUTE),
+    AudioAIFunction.TEXT_TO_SPEECH: 0.17 / MS_PER_MINUTE,
+    AudioAIFunction.CLONE_VOICE: 5 / 30 / MS_PER_MINUTE,
+}
+
 def estimate_cost(audio_length_ms: int, function: AudioAIFunction) -> float:
     """
     Calculate the estimated cost for various ElevenLabs API operations.
@@ -32,18 +121,7 @@ def estimate_cost(audio_length_ms: int, function: AudioAIFunction) -> float:
     Raises:
         ValueError: If function type is not recognized
     """
-    match function:
-        case AudioAIFunction.CLEAN:
-            minutes = audio_length_ms/1000/60
-            return minutes * 1000 * 5 / 30000
-        case AudioAIFunction.SPEECH_TO_TEXT:
-            hours = audio_length_ms / 1000 / 60 / 60
-            return hours * 0.40
-        case AudioAIFunction.TEXT_TO_SPEECH:
-            minutes = audio_length_ms / 1000 / 60
-            return minutes * 0.17
-        case AudioAIFunction.CLONE_VOICE:
-            minutes = audio_length_ms / 1000 / 60
-            return minutes * 5 / 30
-        case _:
-            raise ValueError(f"Unknown function type: {function}.")
+    try:
+        return audio_length_ms * COST_PER_MS[function]
+    except KeyError:
+        raise ValueError(f"Unknown function type: {function}.")
@@ -1,10 +1,21 @@
-from collections import defaultdict
-from elevenlabs import ElevenLabs, SpeechToTextWordResponseModel
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .transcription_processing import TranscribedWord
 
 # Import the singleton client getter
 from .config import get_elevenlabs_client
+from .utils import call_with_rate_limit_retry
+
+@lru_cache(maxsize=1)
+def _fetch_voices() -> tuple:
+    """Fetch all voices once per process; cleared whenever voices are added or deleted."""
+    return tuple(get_elevenlabs_client().voices.get_all().voices)
 
 class VoiceManager:
     """Handles voice-related operations including cloning and sample management"""
@@ -17,8 +28,7 @@ class VoiceManager:
     def get_available_voices(self) -> list:
         """Get available voices from ElevenLabs (excluding premade)."""
         if self.available_voices is None:
-            all_voices = self.client.voices.get_all().voices
-            self.available_voices = list(filter(lambda v: v.category != "premade", all_voices))
+            self.available_voices = [v for v in _fetch_voices() if v.category != "premade"]
         return self.available_voices
 
     def clone_voice(self, voice_sample_filepath: str, voice_name: str) -> str:
@@ -26,41 +36,69 @@ class VoiceManager:
         Clone a single voice using ElevenLabs.
         """
         sample_path = Path(voice_sample_filepath)
-        if not sample_path.exists():
-            raise FileNotFoundError(f"Sample file not found: {sample_path}")
-        if sample_path.stat().st_size == 0:
+        try:
+            sample_size = sample_path.stat().st_size
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Sample file not found: {sample_path}") from None
+        if sample_size == 0:
             raise ValueError(f"Empty sample file: {sample_path}")
 
         with open(sample_path, 'rb') as f:
-            voice = self.client.voices.add(
-                name=voice_name,
-                files=[f],
-            )
+            def add_voice():
+                f.seek(0) # A retried upload must send the sample from the start
+                return self.client.voices.add(
+                    name=voice_name,
+                    files=[f],
+                )
+            
+            # Clones run concurrently, so back off if the plan's request limit is hit
+            voice = call_with_rate_limit_retry(add_voice)
+        _fetch_voices.cache_clear()
         print(f"Successfully cloned voice '{voice_name}' ({voice.voice_id})")
         return voice.voice_id
 
     def delete_generated_voices(self, speaker_voice_ids: dict):
         """Delete generated voices by ID."""
         print("Deleting generated voices...")
-        deleted_count = 0
-        for voice_id in speaker_voice_ids.values():
+        def delete_voice(voice_id: str) -> bool:
             try:
-                self.client.voices.delete(voice_id)
-                deleted_count += 1
+                # Concurrent deletes can hit the plan's request limit; a voice left behind keeps using a slot
+                call_with_rate_limit_retry(self.client.voices.delete, voice_id)
+                return True
             except Exception as e:
-                 print(f"Warning: Could not delete voice {voice_id}: {e}")
+                print(f"Warning: Could not delete voice {voice_id}: {e}")
+                return False
+        
+        # Deletions are independent requests, so issue them concurrently
+        with ThreadPoolExecutor(max_workers=max(len(speaker_voice_ids), 1)) as executor:
+            deleted_count = sum(executor.map(delete_voice, speaker_voice_ids.values()))
+        _fetch_voices.cache_clear()
         print(f"Deleted {deleted_count} voices.")
 
-    def extract_samples_from_transcription(self, raw_transcription: list[SpeechToTextWordResponseModel], clone_sample_length_ms: int) -> dict[str, list[tuple[int, int]]]:
-        """Extract samples from a raw transcription."""
-        samples = defaultdict(list)
-        samples_length = defaultdict(int)
-        for word in raw_transcription:
-            # Add type check for word object
-            assert word.speaker_id and word.start and word.end
-            if hasattr(word, 'speaker_id') and hasattr(word, 'start') and hasattr(word, 'end'):
-                speaker_id = word.speaker_id
-            if speaker_id and samples_length[speaker_id] < clone_sample_length_ms:
-                samples[speaker_id].append((word.start * 1000, word.end * 1000))
-                samples_length[speaker_id] += int((word.end - word.start) * 1000)
+    def extract_samples_from_transcription(self, raw_transcription: list["TranscribedWord"], clone_sample_length_ms: int) -> dict[str, list[tuple[int, int]]]:
+        """
+        Extract samples from a raw transcription.
+        
+        Each speaker gets their words in order until clone_sample_length_ms of audio
+        has been collected (the word crossing the limit is included).
+        """
+        import numpy as np
+        
+        words = [word for word in raw_transcription if word.speaker_id]
+        if not words:
+            return {}
+        # One pass over the words; missing timestamps become NaN and are zeroed
+        speaker_ids, starts, ends = zip(*map(attrgetter('speaker_id', 'start', 'end'), words))
+        speakers = np.array(speaker_ids)
+        starts_ms = np.nan_to_num(np.array(starts, dtype=np.float64)) * 1000
+        ends_ms = np.nan_to_num(np.array(ends, dtype=np.float64)) * 1000
+        durations_ms = (ends_ms - starts_ms).astype(np.int64)
+        
+        samples = {}
+        for speaker_id in dict.fromkeys(speakers.tolist()):
+            indices = np.flatnonzero(speakers == speaker_id)
+            # Audio already collected for this speaker before each of their words
+            collected_ms = np.cumsum(durations_ms[indices]) - durations_ms[indices]
+            keep = indices[collected_ms < clone_sample_length_ms]
+            samples[speaker_id] = list(zip(starts_ms[keep].tolist(), ends_ms[keep].tolist()))
         return samples